@@ -19,6 +19,8 @@ Date: 2025-11-03
 
 import sys
 import re
+import array
+import functools
 from typing import Dict, List, Tuple, Optional
 
 class SymbolTable:
@@ -42,6 +44,29 @@ class SymbolTable:
         return label in self.symbols
 
 
+def encode_data_processing(cond: int, opcode: int, s: int, rn: int,
+                           rd: int, operand2: int) -> int:
+    """Encode data processing instruction"""
+    # Format: [cond:4][00][I:1][opcode:4][S:1][Rn:4][Rd:4][operand2:12]
+    return ((cond << 28) | (opcode << 21) | (s << 20) |
+            (rn << 16) | (rd << 12) | operand2)
+
+
+def encode_branch(cond: int, link: int, offset: int) -> int:
+    """Encode branch instruction"""
+    # Format: [cond:4][101][L:1][offset:24]
+    return (cond << 28) | (0b101 << 25) | (link << 24) | (offset & 0xFFFFFF)
+
+
+def encode_load_store(cond: int, p: int, u: int, b: int, w: int, l: int,
+                      rn: int, rd: int, offset: int) -> int:
+    """Encode load/store instruction"""
+    # Format: [cond:4][01][I][P][U][B][W][L][Rn:4][Rd:4][offset:12]
+    return ((cond << 28) | (0b01 << 26) | (p << 24) | (u << 23) |
+            (b << 22) | (w << 21) | (l << 20) |
+            (rn << 16) | (rd << 12) | (offset & 0xFFF))
+
+
 class ARM7Instruction:
     """Represents an ARM7 instruction encoding"""
     
@@ -80,32 +105,95 @@ class ARM7Instruction:
     OP_BIC = 0b1110
     OP_MVN = 0b1111
     
-    @staticmethod
-    def encode_data_processing(cond: int, opcode: int, s: int, rn: int, 
-                               rd: int, operand2: int) -> int:
-        """Encode data processing instruction"""
-        # Format: [cond:4][00][I:1][opcode:4][S:1][Rn:4][Rd:4][operand2:12]
-        instr = (cond << 28) | (0b00 << 26) | (opcode << 21) | (s << 20)
-        instr |= (rn << 16) | (rd << 12) | operand2
-        return instr
+    # Encoders (module-level functions, exposed here for API compatibility)
+    encode_data_processing = staticmethod(encode_data_processing)
+    encode_branch = staticmethod(encode_branch)
+    encode_load_store = staticmethod(encode_load_store)
+
+
+# Condition code suffixes (no suffix means AL)
+COND_MAP = {
+    'EQ': ARM7Instruction.COND_EQ,
+    'NE': ARM7Instruction.COND_NE,
+    'CS': ARM7Instruction.COND_CS,
+    'CC': ARM7Instruction.COND_CC,
+    'MI': ARM7Instruction.COND_MI,
+    'PL': ARM7Instruction.COND_PL,
+    'VS': ARM7Instruction.COND_VS,
+    'VC': ARM7Instruction.COND_VC,
+    'HI': ARM7Instruction.COND_HI,
+    'LS': ARM7Instruction.COND_LS,
+    'GE': ARM7Instruction.COND_GE,
+    'LT': ARM7Instruction.COND_LT,
+    'GT': ARM7Instruction.COND_GT,
+    'LE': ARM7Instruction.COND_LE,
+    'AL': ARM7Instruction.COND_AL,
+}
+
+# Mnemonic = base + optional condition, with the S flag accepted either
+# before (UAL: ADDSEQ) or after (pre-UAL: ADDEQS) the condition.
+# B is listed before BL so that BLS/BLE decode as B + LS/LE.
+_MNEMONIC_RE = re.compile(
+    r'(ADD|SUB|RSB|ADC|SBC|RSC|AND|ORR|EOR|BIC|MOV|MVN|TST|TEQ|CMP|CMN'
+    r'|B|BL|LDRB|STRB|LDR|STR)'
+    r'(S?)(EQ|NE|CS|CC|MI|PL|VS|VC|HI|LS|GE|LT|GT|LE|AL)?(S?)'
+)
+
+# Data processing opcodes by mnemonic
+_OPCODE_MAP = {
+    'AND': ARM7Instruction.OP_AND,
+    'EOR': ARM7Instruction.OP_EOR,
+    'SUB': ARM7Instruction.OP_SUB,
+    'RSB': ARM7Instruction.OP_RSB,  # Reverse subtract
+    'ADD': ARM7Instruction.OP_ADD,
+    'ADC': ARM7Instruction.OP_ADC,  # Add with carry
+    'SBC': ARM7Instruction.OP_SBC,  # Subtract with carry
+    'RSC': ARM7Instruction.OP_RSC,  # Reverse subtract with carry
+    'TST': ARM7Instruction.OP_TST,  # Test
+    'TEQ': ARM7Instruction.OP_TEQ,  # Test equivalence
+    'CMP': ARM7Instruction.OP_CMP,  # Compare
+    'CMN': ARM7Instruction.OP_CMN,  # Compare negative
+    'ORR': ARM7Instruction.OP_ORR,
+    'MOV': ARM7Instruction.OP_MOV,
+    'BIC': ARM7Instruction.OP_BIC,  # Bit clear
+    'MVN': ARM7Instruction.OP_MVN,  # Move not
+}
+
+# Instruction classes used for dispatch
+_DATA_PROCESSING = frozenset(_OPCODE_MAP)
+_MOV_LIKE = frozenset({'MOV', 'MVN'})                 # OP Rd, operand2
+_CMP_LIKE = frozenset({'CMP', 'CMN', 'TST', 'TEQ'})   # OP Rn, operand2
+_BRANCHES = frozenset({'B', 'BL'})
+_LOAD_STORE = frozenset({'LDR', 'STR', 'LDRB', 'STRB'})
+_LOADS = frozenset({'LDR', 'LDRB'})
+_BYTE_TRANSFERS = frozenset({'LDRB', 'STRB'})
+
+# Tokenizer translation table (operands are separated by commas/whitespace)
+_COMMA_TO_SPACE = str.maketrans(',', ' ')
+
+# Register name -> number, including aliases and lowercase spellings
+_REG_TABLE = {f'R{n}': n for n in range(16)}
+_REG_TABLE.update({'SP': 13, 'LR': 14, 'PC': 15})
+_REG_TABLE.update({name.lower(): num for name, num in list(_REG_TABLE.items())})
+_REG_RE = re.compile(r'R(\d+)')
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_immediate(imm_str: str) -> int:
+    """Parse immediate value (cached: programs reuse a few constants)"""
+    imm_str = imm_str.strip()
     
-    @staticmethod
-    def encode_branch(cond: int, link: int, offset: int) -> int:
-        """Encode branch instruction"""
-        # Format: [cond:4][101][L:1][offset:24]
-        offset_24 = offset & 0xFFFFFF  # 24-bit signed offset
-        instr = (cond << 28) | (0b101 << 25) | (link << 24) | offset_24
-        return instr
+    # Handle #prefix
+    if imm_str.startswith('#'):
+        imm_str = imm_str[1:]
     
-    @staticmethod
-    def encode_load_store(cond: int, p: int, u: int, b: int, w: int, l: int,
-                          rn: int, rd: int, offset: int) -> int:
-        """Encode load/store instruction"""
-        # Format: [cond:4][01][I][P][U][B][W][L][Rn:4][Rd:4][offset:12]
-        instr = (cond << 28) | (0b01 << 26) | (p << 24) | (u << 23)
-        instr |= (b << 22) | (w << 21) | (l << 20)
-        instr |= (rn << 16) | (rd << 12) | (offset & 0xFFF)
-        return instr
+    # Parse hex, binary, or decimal
+    if imm_str.startswith('0x') or imm_str.startswith('0X'):
+        return int(imm_str, 16)
+    elif imm_str.startswith('0b') or imm_str.startswith('0B'):
+        return int(imm_str, 2)
+    else:
+        return int(imm_str)
 
 
 class Assembler:
@@ -120,19 +208,17 @@ class Assembler:
         
     def parse_register(self, reg_str: str) -> int:
         """Parse register name to number (R0-R15)"""
-        reg_str = reg_str.upper().strip()
-        
-        # Handle special register names
-        reg_map = {
-            'SP': 13, 'LR': 14, 'PC': 15,
-            'R13': 13, 'R14': 14, 'R15': 15
-        }
+        reg_num = _REG_TABLE.get(reg_str)
+        if reg_num is not None:
+            return reg_num
         
-        if reg_str in reg_map:
-            return reg_map[reg_str]
+        # Slow path: surrounding whitespace, mixed case or trailing text
+        reg_str = reg_str.upper().strip()
+        if reg_str in _REG_TABLE:
+            return _REG_TABLE[reg_str]
         
         # Parse R0-R15
-        match = re.match(r'R(\d+)', reg_str)
+        match = _REG_RE.match(reg_str)
         if match:
             reg_num = int(match.group(1))
             if 0 <= reg_num <= 15:
@@ -142,47 +228,20 @@ class Assembler:
     
     def parse_immediate(self, imm_str: str) -> int:
         """Parse immediate value"""
-        imm_str = imm_str.strip()
-        
-        # Handle #prefix
-        if imm_str.startswith('#'):
-            imm_str = imm_str[1:]
-        
-        # Parse hex, binary, or decimal
-        if imm_str.startswith('0x') or imm_str.startswith('0X'):
-            return int(imm_str, 16)
-        elif imm_str.startswith('0b') or imm_str.startswith('0B'):
-            return int(imm_str, 2)
-        else:
-            return int(imm_str)
+        return _parse_immediate(imm_str)
     
-    def parse_condition(self, mnemonic: str) -> Tuple[str, int]:
-        """Extract condition code from mnemonic"""
-        cond_map = {
-            'EQ': ARM7Instruction.COND_EQ,
-            'NE': ARM7Instruction.COND_NE,
-            'CS': ARM7Instruction.COND_CS,
-            'CC': ARM7Instruction.COND_CC,
-            'MI': ARM7Instruction.COND_MI,
-            'PL': ARM7Instruction.COND_PL,
-            'VS': ARM7Instruction.COND_VS,
-            'VC': ARM7Instruction.COND_VC,
-            'HI': ARM7Instruction.COND_HI,
-            'LS': ARM7Instruction.COND_LS,
-            'GE': ARM7Instruction.COND_GE,
-            'LT': ARM7Instruction.COND_LT,
-            'GT': ARM7Instruction.COND_GT,
-            'LE': ARM7Instruction.COND_LE,
-        }
-        
-        # Check for condition suffix
-        for suffix, code in cond_map.items():
-            if mnemonic.upper().endswith(suffix):
-                base = mnemonic[:-len(suffix)]
-                return base, code
+    def parse_condition(self, mnemonic: str) -> Tuple[str, int, int]:
+        """Split mnemonic into base, condition code and S flag"""
+        mnemonic = mnemonic.upper()
+        match = _MNEMONIC_RE.fullmatch(mnemonic)
+        if match is None:
+            # Unknown base mnemonic - reported by the caller
+            return mnemonic, ARM7Instruction.COND_AL, 0
         
-        # Default: always
-        return mnemonic, ARM7Instruction.COND_AL
+        base, s_pre, cond, s_post = match.groups()
+        cond_code = COND_MAP[cond] if cond else ARM7Instruction.COND_AL
+        s_flag = 1 if (s_pre or s_post) else 0
+        return base, cond_code, s_flag
     
     def assemble_line(self, line: str, address: int) -> Optional[int]:
         """Assemble a single line of code"""
@@ -194,40 +253,45 @@ class Assembler:
         if not line:
             return None
         
+        return self._encode(line, address)
+    
+    def _encode(self, line: str, address: int) -> int:
+        """Encode an instruction with comments, label and padding removed"""
         # Parse instruction
-        parts = re.split(r'[,\s]+', line)
-        mnemonic = parts[0].upper()
-        
-        # Extract condition code
-        base_mnemonic, cond = self.parse_condition(mnemonic)
+        parts = line.translate(_COMMA_TO_SPACE).split()
+        if not parts:
+            # Only separators left (e.g. 'loop: ,')
+            self.errors.append("Unknown instruction: ")
+            return 0
         
-        # Check for S suffix (update flags)
-        s_flag = 0
-        if base_mnemonic.endswith('S'):
-            s_flag = 1
-            base_mnemonic = base_mnemonic[:-1]
+        # Extract condition code and S suffix (update flags)
+        base_mnemonic, cond, s_flag = self.parse_condition(parts[0])
         
         try:
             # Data processing instructions
-            if base_mnemonic in ['ADD', 'SUB', 'RSB', 'ADC', 'SBC', 'RSC',
-                                 'AND', 'ORR', 'EOR', 'BIC', 'MOV', 'MVN',
-                                 'TST', 'TEQ', 'CMP', 'CMN']:
+            if base_mnemonic in _DATA_PROCESSING:
                 return self.assemble_data_processing(base_mnemonic, parts[1:],
                                                      cond, s_flag)
 
             # Branch instructions
-            elif base_mnemonic in ['B', 'BL']:
+            elif base_mnemonic in _BRANCHES:
                 return self.assemble_branch(base_mnemonic, parts[1:],
                                            cond, address)
 
             # Load/Store instructions
-            elif base_mnemonic in ['LDR', 'STR', 'LDRB', 'STRB']:
-                return self.assemble_load_store(base_mnemonic, parts[1:], cond)
+            elif base_mnemonic in _LOAD_STORE:
+                # Raw operand text after the mnemonic and its separator
+                start = line.index(parts[0]) + len(parts[0])
+                return self.assemble_load_store(base_mnemonic,
+                                                line[start:].lstrip(', \t'), cond)
 
             else:
-                self.errors.append(f"Unknown instruction: {mnemonic}")
+                self.errors.append(f"Unknown instruction: {parts[0].upper()}")
                 return 0
                 
+        except IndexError:
+            self.errors.append(f"Error assembling '{line}': missing operand")
+            return 0
         except Exception as e:
             self.errors.append(f"Error assembling '{line}': {str(e)}")
             return 0
@@ -235,29 +299,10 @@ class Assembler:
     def assemble_data_processing(self, mnemonic: str, operands: List[str],
                                  cond: int, s: int) -> int:
         """Assemble data processing instruction"""
-        opcode_map = {
-            'AND': ARM7Instruction.OP_AND,
-            'EOR': ARM7Instruction.OP_EOR,
-            'SUB': ARM7Instruction.OP_SUB,
-            'RSB': 0b0011,  # Reverse subtract
-            'ADD': ARM7Instruction.OP_ADD,
-            'ADC': 0b0101,  # Add with carry
-            'SBC': 0b0110,  # Subtract with carry
-            'RSC': 0b0111,  # Reverse subtract with carry
-            'TST': 0b1000,  # Test
-            'TEQ': 0b1001,  # Test equivalence
-            'CMP': 0b1010,  # Compare
-            'CMN': 0b1011,  # Compare negative
-            'ORR': ARM7Instruction.OP_ORR,
-            'MOV': ARM7Instruction.OP_MOV,
-            'BIC': 0b1110,  # Bit clear
-            'MVN': 0b1111,  # Move not
-        }
-
-        opcode = opcode_map.get(mnemonic, 0)
+        opcode = _OPCODE_MAP.get(mnemonic, 0)
 
         # MOV and MVN have different format: MOV Rd, operand2
-        if mnemonic in ['MOV', 'MVN']:
+        if mnemonic in _MOV_LIKE:
             rd = self.parse_register(operands[0])
             # Check if operand2 is immediate or register
             if operands[1].startswith('#') or operands[1].isdigit():
@@ -266,11 +311,11 @@ class Assembler:
                 # Register operand (encoded as shift by 0)
                 rm = self.parse_register(operands[1])
                 operand2 = rm  # Simple register, no shift
-            return ARM7Instruction.encode_data_processing(cond, opcode, s,
-                                                         0, rd, operand2)
+            return encode_data_processing(cond, opcode, s,
+                                          0, rd, operand2)
 
         # CMP, CMN, TST, TEQ don't write to Rd
-        if mnemonic in ['CMP', 'CMN', 'TST', 'TEQ']:
+        if mnemonic in _CMP_LIKE:
             rn = self.parse_register(operands[0])
             # Check if operand2 is immediate or register
             if operands[1].startswith('#') or operands[1].isdigit():
@@ -278,8 +323,8 @@ class Assembler:
             else:
                 rm = self.parse_register(operands[1])
                 operand2 = rm
-            return ARM7Instruction.encode_data_processing(cond, opcode, 1,  # S=1 for compare
-                                                         rn, 0, operand2)
+            return encode_data_processing(cond, opcode, 1,  # S=1 for compare
+                                          rn, 0, operand2)
 
         # Standard format: OP Rd, Rn, operand2
         rd = self.parse_register(operands[0])
@@ -293,8 +338,8 @@ class Assembler:
             rm = self.parse_register(operands[2])
             operand2 = rm  # Simple register, no shift
 
-        return ARM7Instruction.encode_data_processing(cond, opcode, s,
-                                                     rn, rd, operand2)
+        return encode_data_processing(cond, opcode, s,
+                                      rn, rd, operand2)
     
     def assemble_branch(self, mnemonic: str, operands: List[str],
                        cond: int, current_addr: int) -> int:
@@ -312,32 +357,43 @@ class Assembler:
             # Calculate offset (in words, PC+8 relative)
             offset = ((target_addr - current_addr - 8) >> 2) & 0xFFFFFF
         
-        return ARM7Instruction.encode_branch(cond, link, offset)
+        return encode_branch(cond, link, offset)
     
-    def assemble_load_store(self, mnemonic: str, operands: List[str],
+    def assemble_load_store(self, mnemonic: str, operand_str: str,
                            cond: int) -> int:
         """Assemble load/store instruction"""
-        l = 1 if mnemonic in ['LDR', 'LDRB'] else 0
-        b = 1 if mnemonic in ['LDRB', 'STRB'] else 0  # Byte transfer
-        rd = self.parse_register(operands[0])
+        l = 1 if mnemonic in _LOADS else 0
+        b = 1 if mnemonic in _BYTE_TRANSFERS else 0  # Byte transfer
 
         # Simple immediate offset: LDR Rd, [Rn, #offset]
         # Parse [Rn, #offset] or [Rn]
-        addr_str = ' '.join(operands[1:]).replace('[', '').replace(']', '')
-        addr_parts = addr_str.split(',')
+        start = operand_str.find('[')
+        if start >= 0:
+            end = operand_str.find(']', start + 1)
+            if end < 0:
+                raise ValueError(f"Invalid address: {operand_str[start:].strip()}")
+            rd_str = operand_str[:start]
+            addr_str = operand_str[start + 1:end]
+        else:
+            # Bracketless form: LDR Rd, Rn[, #offset]
+            rd_str, _, addr_str = operand_str.partition(',')
+        rd = self.parse_register(rd_str.rstrip(', \t'))
+        base, _, off = addr_str.partition(',')
 
-        rn = self.parse_register(addr_parts[0])
-        offset = 0 if len(addr_parts) == 1 else self.parse_immediate(addr_parts[1])
+        rn = self.parse_register(base)
+        offset = self.parse_immediate(off) if off.strip() else 0
 
         # P=1 (pre-indexed), U=1 (add offset), W=0 (no writeback)
-        return ARM7Instruction.encode_load_store(cond, 1, 1, b, 0, l,
-                                                rn, rd, offset)
+        return encode_load_store(cond, 1, 1, b, 0, l,
+                                 rn, rd, offset)
     
     def assemble(self, source_lines: List[str]) -> List[int]:
         """Two-pass assembly"""
         # Pass 1: Build symbol table
         address = 0
-        for line in source_lines:
+        for original in source_lines:
+            line = original
+
             # Remove comments
             if ';' in line:
                 line = line[:line.index(';')]
@@ -358,14 +414,13 @@ class Assembler:
 
             # Store instruction for pass 2 only if there's content
             if line:
-                self.instructions.append((address, line, line))
+                self.instructions.append((address, line, original.strip()))
                 address += 4
 
-        # Pass 2: Generate machine code
-        for address, line, original in self.instructions:
-            machine_code = self.assemble_line(line, address)
-            if machine_code is not None:
-                self.machine_code.append(machine_code)
+        # Pass 2: Generate machine code from the already-cleaned lines
+        encode = self._encode
+        self.machine_code.extend([encode(line, address)
+                                  for address, line, original in self.instructions])
 
         return self.machine_code
 
@@ -384,7 +439,7 @@ def main():
     
     # Read source file
     with open(input_file, 'r') as f:
-        source_lines = f.readlines()
+        source_lines = f.read().splitlines()
     
     # Assemble
     assembler = Assembler()
@@ -398,9 +453,11 @@ def main():
         sys.exit(1)
     
     # Write output
+    words = array.array('I', machine_code)
+    if sys.byteorder != 'little':
+        words.byteswap()
     with open(output_file, 'wb') as f:
-        for instr in machine_code:
-            f.write(instr.to_bytes(4, byteorder='little'))
+        words.tofile(f)
     
     print(f"Assembly successful: {len(machine_code)} instructions")
     print(f"Output written to: {output_file}")
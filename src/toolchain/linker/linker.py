@@ -19,6 +19,9 @@ import argparse
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+# Little-endian 32-bit word, used to patch relocated instructions in place
+_U32 = struct.Struct('<I')
+
 class Symbol:
     """Represents a symbol in an object file"""
     def __init__(self, name: str, value: int, section: str, is_global: bool = False):
@@ -51,6 +54,7 @@ class ObjectFile:
         self.sections = {}
         self.symbols = {}
         self.relocations = []
+        self.local_symbols = {}  # Merged local symbols, keyed by bare name
 
 class Linker:
     """ARM7 Linker"""
@@ -81,6 +85,7 @@ class Linker:
     def parse_object_file(self, filename: str) -> ObjectFile:
         """Parse object file (simplified format)"""
         obj = ObjectFile(filename)
+        data_chunks: Dict[str, List[bytes]] = {}
         
         # For this implementation, we'll use a simple text-based format
         # Real implementation would use ELF or custom binary format
@@ -98,14 +103,12 @@ class Linker:
                 if cmd == 'SECTION':
                     section_name = parts[1]
                     obj.sections[section_name] = Section(section_name)
+                    data_chunks[section_name] = []
                     current_section = section_name
                 
                 elif cmd == 'DATA':
-                    # DATA <hex_bytes>
-                    hex_data = parts[1]
-                    data = bytes.fromhex(hex_data)
-                    obj.sections[current_section].data.extend(data)
-                    obj.sections[current_section].size = len(obj.sections[current_section].data)
+                    # DATA <hex_bytes> (joined once per section below)
+                    data_chunks[current_section].append(bytes.fromhex(parts[1]))
                 
                 elif cmd == 'SYMBOL':
                     # SYMBOL <name> <value> <section> [GLOBAL]
@@ -123,21 +126,35 @@ class Linker:
                     section = parts[4]
                     obj.relocations.append(Relocation(offset, symbol, rel_type, section))
         
+        # Build each section's data with a single join
+        for section_name, chunks in data_chunks.items():
+            section = obj.sections[section_name]
+            section.data = bytearray().join(chunks)
+            section.size = len(section.data)
+        
         return obj
     
     def merge_sections(self):
         """Merge sections from all object files"""
+        # Collect each section's pieces and join them once at the end
+        merged_chunks: Dict[str, List[bytes]] = {
+            name: [section.data] for name, section in self.sections.items()
+        }
+        merged_sizes = {name: len(section.data) for name, section in self.sections.items()}
+        
         for obj in self.object_files:
             for section_name, section in obj.sections.items():
                 if section_name not in self.sections:
                     self.sections[section_name] = Section(section_name)
+                    merged_chunks[section_name] = []
+                    merged_sizes[section_name] = 0
                 
                 # Record where this object's section starts in merged section
-                obj_section_offset = len(self.sections[section_name].data)
+                obj_section_offset = merged_sizes[section_name]
                 
                 # Merge data
-                self.sections[section_name].data.extend(section.data)
-                self.sections[section_name].size = len(self.sections[section_name].data)
+                merged_chunks[section_name].append(section.data)
+                merged_sizes[section_name] += len(section.data)
                 
                 # Update symbol addresses
                 for sym_name, symbol in obj.symbols.items():
@@ -154,11 +171,17 @@ class Linker:
                             # Local symbols get prefixed with filename
                             local_name = f"{obj.filename}:{sym_name}"
                             self.global_symbols[local_name] = global_sym
+                            obj.local_symbols[sym_name] = global_sym
                 
                 # Adjust relocations
                 for reloc in obj.relocations:
                     if reloc.section == section_name:
                         reloc.offset += obj_section_offset
+        
+        for section_name, chunks in merged_chunks.items():
+            merged = self.sections[section_name]
+            merged.data = bytearray().join(chunks)
+            merged.size = len(merged.data)
     
     def assign_addresses(self):
         """Assign final addresses to sections"""
@@ -174,61 +197,70 @@ class Linker:
     
     def apply_relocations(self):
         """Apply relocations to resolve symbol references"""
+        # Resolve symbols and group relocations by (section, type)
+        grouped: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        find_global = self.global_symbols.get
         for obj in self.object_files:
+            find_local = obj.local_symbols.get
             for reloc in obj.relocations:
-                # Find symbol
-                symbol = self.global_symbols.get(reloc.symbol)
-                if not symbol:
-                    # Try with filename prefix
-                    symbol = self.global_symbols.get(f"{obj.filename}:{reloc.symbol}")
+                # Find symbol (global first, then this object's locals)
+                symbol = find_global(reloc.symbol) or find_local(reloc.symbol)
                 
                 if not symbol:
                     print(f"Error: Undefined symbol '{reloc.symbol}'")
                     continue
                 
-                # Get section
-                section = self.sections.get(reloc.section)
-                if not section:
-                    continue
-                
-                # Apply relocation based on type
-                if reloc.rel_type == 'abs32':
-                    # Absolute 32-bit address
-                    addr = symbol.resolved_addr
-                    section.data[reloc.offset:reloc.offset+4] = struct.pack('<I', addr)
-                
-                elif reloc.rel_type == 'rel24':
-                    # Relative 24-bit (for branches)
-                    current_addr = section.base_addr + reloc.offset
-                    target_addr = symbol.resolved_addr
-                    offset = (target_addr - current_addr - 8) >> 2  # ARM PC+8, word offset
+                key = (reloc.section, reloc.rel_type)
+                grouped.setdefault(key, []).append((reloc.offset, symbol.resolved_addr))
+        
+        # Patch each section's buffer in place
+        for (section_name, rel_type), entries in grouped.items():
+            section = self.sections.get(section_name)
+            if not section:
+                continue
+            buf = section.data
+            pack_into = _U32.pack_into
+            
+            if rel_type == 'abs32':
+                # Absolute 32-bit address
+                for offset, target_addr in entries:
+                    pack_into(buf, offset, target_addr)
+            
+            elif rel_type == 'rel24':
+                # Relative 24-bit (for branches), ARM PC+8, word offset
+                base_addr = section.base_addr
+                unpack_from = _U32.unpack_from
+                for offset, target_addr in entries:
+                    rel = (target_addr - (base_addr + offset) - 8) >> 2
                     
-                    # Read existing instruction
-                    instr = struct.unpack('<I', section.data[reloc.offset:reloc.offset+4])[0]
-                    # Update offset field (bits 0-23)
-                    instr = (instr & 0xFF000000) | (offset & 0x00FFFFFF)
-                    section.data[reloc.offset:reloc.offset+4] = struct.pack('<I', instr)
+                    # Update offset field (bits 0-23) of the existing instruction
+                    instr = unpack_from(buf, offset)[0]
+                    pack_into(buf, offset, (instr & 0xFF000000) | (rel & 0x00FFFFFF))
     
     def generate_output(self, output_file: str, format: str = 'bin'):
         """Generate output executable"""
         if format == 'bin':
-            # Raw binary format
-            with open(output_file, 'wb') as f:
-                # Write .text section
-                if '.text' in self.sections:
-                    f.write(self.sections['.text'].data)
+            # Raw binary format, assembled in memory and written once
+            chunks = []
+            
+            # .text section
+            if '.text' in self.sections:
+                chunks.append(self.sections['.text'].data)
+            
+            # .data section (if contiguous)
+            if '.data' in self.sections:
+                text_end = self.sections['.text'].base_addr + self.sections['.text'].size
+                data_start = self.sections['.data'].base_addr
                 
-                # Write .data section (if contiguous)
-                if '.data' in self.sections:
-                    text_end = self.sections['.text'].base_addr + self.sections['.text'].size
-                    data_start = self.sections['.data'].base_addr
-                    
-                    if data_start > text_end:
-                        # Pad between sections
-                        padding = data_start - text_end
-                        f.write(b'\x00' * padding)
-                    
-                    f.write(self.sections['.data'].data)
+                if data_start > text_end:
+                    # Pad between sections
+                    padding = data_start - text_end
+                    chunks.append(b'\x00' * padding)
+                
+                chunks.append(self.sections['.data'].data)
+            
+            with open(output_file, 'wb') as f:
+                f.write(b''.join(chunks))
         
         elif format == 'hex':
             # Intel HEX format
@@ -236,23 +268,25 @@ class Linker:
     
     def write_hex_file(self, filename: str):
         """Write Intel HEX format"""
-        with open(filename, 'w') as f:
-            for section_name in ['.text', '.data']:
-                if section_name not in self.sections:
-                    continue
-                
-                section = self.sections[section_name]
-                addr = section.base_addr
-                data = section.data
-                
-                # Write in 16-byte records
-                for i in range(0, len(data), 16):
-                    chunk = data[i:i+16]
-                    record = self.create_hex_record(addr + i, chunk)
-                    f.write(record + '\n')
+        lines = []
+        for section_name in ['.text', '.data']:
+            if section_name not in self.sections:
+                continue
+            
+            section = self.sections[section_name]
+            addr = section.base_addr
+            data = memoryview(section.data)  # zero-copy record slices
             
-            # End of file record
-            f.write(':00000001FF\n')
+            # 16-byte records
+            create = self.create_hex_record
+            lines.extend([create(addr + i, data[i:i+16])
+                          for i in range(0, len(data), 16)])
+        
+        # End of file record
+        lines.append(':00000001FF\n')
+        
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines))
     
     def create_hex_record(self, addr: int, data: bytes) -> str:
         """Create Intel HEX record"""
@@ -261,17 +295,10 @@ class Linker:
         addr_low = addr & 0xFF
         record_type = 0x00
         
-        record = f":{byte_count:02X}{addr_high:02X}{addr_low:02X}{record_type:02X}"
-        checksum = byte_count + addr_high + addr_low + record_type
-        
-        for byte in data:
-            record += f"{byte:02X}"
-            checksum += byte
-        
-        checksum = (-checksum) & 0xFF
-        record += f"{checksum:02X}"
+        checksum = (-(byte_count + addr_high + addr_low + record_type + sum(data))) & 0xFF
         
-        return record
+        return (f":{byte_count:02X}{addr_high:02X}{addr_low:02X}{record_type:02X}"
+                f"{data.hex().upper()}{checksum:02X}")
     
     def link(self, output_file: str, format: str = 'bin'):
         """Perform linking"""
@@ -12,120 +12,158 @@ Author: ARM7 Computer System Project
 Date: 2025-11-03
 """
 
+import os
+import re
 import sys
-import struct
+import mmap
+import stat
+import array
+import bisect
+import collections
+import contextlib
+import concurrent.futures
+import functools
+import itertools
 import argparse
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Symbol file line: "<hex address> <name> [ignored...]"
+_SYM_RE = re.compile(r'^[ \t]*((?:0[xX])?[0-9A-Fa-f]+)[ \t]+(\S+)', re.MULTILINE)
 
 class ARM7Disassembler:
     """ARM7 instruction disassembler"""
     
-    # Condition codes
-    COND_CODES = {
-        0b0000: 'EQ', 0b0001: 'NE', 0b0010: 'CS', 0b0011: 'CC',
-        0b0100: 'MI', 0b0101: 'PL', 0b0110: 'VS', 0b0111: 'VC',
-        0b1000: 'HI', 0b1001: 'LS', 0b1010: 'GE', 0b1011: 'LT',
-        0b1100: 'GT', 0b1101: 'LE', 0b1110: '',   0b1111: 'NV'
-    }
-    
-    # Data processing opcodes
-    DP_OPCODES = {
-        0b0000: 'AND', 0b0001: 'EOR', 0b0010: 'SUB', 0b0011: 'RSB',
-        0b0100: 'ADD', 0b0101: 'ADC', 0b0110: 'SBC', 0b0111: 'RSC',
-        0b1000: 'TST', 0b1001: 'TEQ', 0b1010: 'CMP', 0b1011: 'CMN',
-        0b1100: 'ORR', 0b1101: 'MOV', 0b1110: 'BIC', 0b1111: 'MVN'
-    }
-    
-    # Shift types
-    SHIFT_TYPES = {
-        0b00: 'LSL', 0b01: 'LSR', 0b10: 'ASR', 0b11: 'ROR'
-    }
+    __slots__ = ('symbols', 'base_addr', '_dispatch', '_decode_cached')
+    
+    # Condition codes, indexed by bits 31:28
+    COND_CODES = (
+        'EQ', 'NE', 'CS', 'CC',     # 0000-0011
+        'MI', 'PL', 'VS', 'VC',     # 0100-0111
+        'HI', 'LS', 'GE', 'LT',     # 1000-1011
+        'GT', 'LE', '',   'NV',     # 1100-1111
+    )
+    
+    # Data processing opcodes, indexed by bits 24:21
+    DP_OPCODES = (
+        'AND', 'EOR', 'SUB', 'RSB',     # 0000-0011
+        'ADD', 'ADC', 'SBC', 'RSC',     # 0100-0111
+        'TST', 'TEQ', 'CMP', 'CMN',     # 1000-1011
+        'ORR', 'MOV', 'BIC', 'MVN',     # 1100-1111
+    )
+    
+    # Shift types, indexed by bits 6:5
+    SHIFT_TYPES = ('LSL', 'LSR', 'ASR', 'ROR')
+    
+    # Precomputed mnemonic prefixes (mnemonic + condition [+ S]), indexed
+    # directly by instruction bits; see the disasm_* methods for the keys
+    _DP_PREFIX = tuple(f"{op}{cond}{s}" for cond, op, s in itertools.product(
+        COND_CODES, DP_OPCODES, ('', 'S')))
+    _LS_PREFIX = tuple(f"{op}{cond}" for cond, op in itertools.product(
+        COND_CODES, ('STR', 'LDR', 'STRB', 'LDRB')))
+    _LDM_PREFIX = tuple(f"{op}{cond}" for cond, op in itertools.product(
+        COND_CODES, ('STM', 'LDM')))
+    _BRANCH_PREFIX = tuple(f"{op}{cond}" for cond, op in itertools.product(
+        COND_CODES, ('B', 'BL')))
+    
+    # Data processing operand shape per opcode: bit 3 = test (no Rd),
+    # bit 2 = move (no Rn)
+    _DP_SHAPE = tuple(((op >> 2 == 0b10) << 3) | (((op & 0b1101) == 0b1101) << 2)
+                      for op in range(16))
+    
+    # Data processing templates keyed by shape | immediate << 1 | shifted;
+    # fields: 0 prefix, 1 Rd, 2 Rn, 3 operand, 4 shift type, 5 shift amount
+    _DP_FMTS = tuple(
+        '{0}' + ('' if test else ' R{1},') + ('' if move else ' R{2},') +
+        (' #0x{3:X}' if imm else ' R{3}' + (', {4} #{5}' if shifted else ''))
+        for test in (0, 1) for move in (0, 1) for imm in (0, 1) for shifted in (0, 1))
+    
+    # Every data processing immediate, indexed by bits 11:0 (rotate:imm8)
+    _DP_IMM = tuple(((imm8 >> (rot * 2)) | (imm8 << (32 - rot * 2))) & 0xFFFFFFFF
+                    for rot in range(16) for imm8 in range(256))
+    
+    # Instructions formatted per block written to stdout
+    BLOCK_WORDS = 4096
+    
+    # Blocks per -j work item, and work items in flight per worker
+    JOB_BLOCKS = 16
+    JOB_BACKLOG = 2
     
     def __init__(self, symbols: Dict[int, str] = None):
         self.symbols = symbols or {}
         self.base_addr = 0
+        
+        # Handlers indexed by bits 27:25 (branches are address-dependent
+        # and handled by disassemble_instruction)
+        self._dispatch = (
+            self._disasm_dp_or_multiply,  # 000 data processing / multiply
+            self._disasm_dp_or_multiply,  # 001 data processing (immediate)
+            self.disasm_load_store,       # 010 load/store (immediate offset)
+            self.disasm_load_store,       # 011 load/store (register offset)
+            self.disasm_ldm_stm,          # 100 load/store multiple
+            None,                         # 101 branch
+            self._disasm_unknown,         # 110 coprocessor
+            self._disasm_swi_or_unknown,  # 111 coprocessor / SWI
+        )
+        
+        # Repeated words (loops, NOPs, common MOVs) decode once
+        self._decode_cached = functools.lru_cache(maxsize=4096)(self._decode_no_addr)
     
     def disassemble_instruction(self, instr: int, addr: int) -> str:
         """Disassemble a single instruction"""
-        # Extract condition code
-        cond = (instr >> 28) & 0xF
-        cond_str = self.COND_CODES.get(cond, '??')
-        
-        # Determine instruction type
-        if (instr & 0x0C000000) == 0x00000000:
-            # Data processing or multiply
-            if (instr & 0x0FC000F0) == 0x00000090:
-                return self.disasm_multiply(instr, cond_str)
-            else:
-                return self.disasm_data_processing(instr, cond_str)
+        if (instr >> 25) & 0x7 == 0b101:
+            # Branch (target depends on the address)
+            return self.disasm_branch(instr, addr)
         
-        elif (instr & 0x0C000000) == 0x04000000:
-            # Load/store
-            return self.disasm_load_store(instr, cond_str)
-        
-        elif (instr & 0x0E000000) == 0x08000000:
-            # Load/store multiple
-            return self.disasm_ldm_stm(instr, cond_str)
-        
-        elif (instr & 0x0E000000) == 0x0A000000:
-            # Branch
-            return self.disasm_branch(instr, cond_str, addr)
-        
-        elif (instr & 0x0F000000) == 0x0F000000:
-            # Software interrupt
-            return self.disasm_swi(instr, cond_str)
-        
-        else:
-            return f"UNKNOWN  0x{instr:08X}"
+        # Everything else only depends on the word itself
+        return self._decode_cached(instr)
+    
+    def _decode_no_addr(self, instr: int) -> str:
+        """Disassemble an address-independent (non-branch) instruction"""
+        # Bits 27:25 select the instruction class
+        return self._dispatch[(instr >> 25) & 0x7](instr)
+    
+    def _disasm_dp_or_multiply(self, instr: int) -> str:
+        """Disassemble data processing or multiply (bits 27:26 = 00)"""
+        if (instr & 0x0FC000F0) == 0x00000090:
+            return self.disasm_multiply(instr)
+        return self.disasm_data_processing(instr)
     
-    def disasm_data_processing(self, instr: int, cond: str) -> str:
+    def _disasm_swi_or_unknown(self, instr: int) -> str:
+        """Disassemble software interrupt (bits 27:24 = 1111)"""
+        if instr & 0x01000000:
+            return self.disasm_swi(instr)
+        return self._disasm_unknown(instr)
+    
+    def _disasm_unknown(self, instr: int) -> str:
+        """Placeholder for unsupported encodings"""
+        return f"UNKNOWN  0x{instr:08X}"
+    
+    def disasm_data_processing(self, instr: int) -> str:
         """Disassemble data processing instruction"""
         opcode = (instr >> 21) & 0xF
-        s_bit = (instr >> 20) & 1
         rn = (instr >> 16) & 0xF
         rd = (instr >> 12) & 0xF
         imm_flag = (instr >> 25) & 1
+        shift_imm = (instr >> 7) & 0x1F
         
-        mnemonic = self.DP_OPCODES.get(opcode, 'UNK')
-        s_suffix = 'S' if s_bit else ''
-        
-        # Test operations don't have destination
-        is_test = opcode in [0b1000, 0b1001, 0b1010, 0b1011]
-        
-        # MOV/MVN don't use first operand
-        is_move = opcode in [0b1101, 0b1111]
-        
-        result = f"{mnemonic}{cond}{s_suffix}"
-        
-        if not is_test:
-            result += f" R{rd},"
-        
-        if not is_move:
-            result += f" R{rn},"
+        # Mnemonic + condition + S suffix, keyed by bits 31:28 and 24:20
+        prefix = self._DP_PREFIX[(((instr >> 28) & 0xF) << 5) | ((instr >> 20) & 0x1F)]
         
         # Second operand
         if imm_flag:
-            # Immediate
-            imm8 = instr & 0xFF
-            rotate = ((instr >> 8) & 0xF) * 2
-            value = self.rotate_right(imm8, rotate)
-            result += f" #0x{value:X}"
+            # Immediate (imm8 rotated right by 2 * rotate field)
+            operand = self._DP_IMM[instr & 0xFFF]
         else:
-            # Register
-            rm = instr & 0xF
-            shift_type = (instr >> 5) & 0x3
-            shift_imm = (instr >> 7) & 0x1F
-            
-            result += f" R{rm}"
-            
-            if shift_imm != 0:
-                shift_name = self.SHIFT_TYPES[shift_type]
-                result += f", {shift_name} #{shift_imm}"
+            # Register (Rm)
+            operand = instr & 0xF
         
-        return result
+        fmt = self._DP_FMTS[self._DP_SHAPE[opcode] | (imm_flag << 1) | (shift_imm != 0)]
+        return fmt.format(prefix, rd, rn, operand,
+                          self.SHIFT_TYPES[(instr >> 5) & 0x3], shift_imm)
     
-    def disasm_multiply(self, instr: int, cond: str) -> str:
+    def disasm_multiply(self, instr: int) -> str:
         """Disassemble multiply instruction"""
+        cond = self.COND_CODES[(instr >> 28) & 0xF]
         rd = (instr >> 16) & 0xF
         rn = (instr >> 12) & 0xF
         rs = (instr >> 8) & 0xF
@@ -133,103 +171,217 @@ class ARM7Disassembler:
         
         return f"MUL{cond} R{rd}, R{rm}, R{rs}"
     
-    def disasm_load_store(self, instr: int, cond: str) -> str:
+    def disasm_load_store(self, instr: int) -> str:
         """Disassemble load/store instruction"""
-        is_load = (instr >> 20) & 1
-        is_byte = (instr >> 22) & 1
         rn = (instr >> 16) & 0xF
         rd = (instr >> 12) & 0xF
         
-        mnemonic = 'LDR' if is_load else 'STR'
-        if is_byte:
-            mnemonic += 'B'
+        # Mnemonic + condition, keyed by cond, B (bit 22) and L (bit 20)
+        prefix = self._LS_PREFIX[(((instr >> 28) & 0xF) << 2) | ((instr >> 21) & 2) | ((instr >> 20) & 1)]
         
         # Offset
         offset = instr & 0xFFF
         
-        return f"{mnemonic}{cond} R{rd}, [R{rn}, #0x{offset:X}]"
+        return f"{prefix} R{rd}, [R{rn}, #0x{offset:X}]"
     
-    def disasm_ldm_stm(self, instr: int, cond: str) -> str:
+    def disasm_ldm_stm(self, instr: int) -> str:
         """Disassemble load/store multiple"""
-        is_load = (instr >> 20) & 1
         rn = (instr >> 16) & 0xF
         reg_list = instr & 0xFFFF
         
-        mnemonic = 'LDM' if is_load else 'STM'
+        # Mnemonic + condition, keyed by cond and L (bit 20)
+        prefix = self._LDM_PREFIX[(((instr >> 28) & 0xF) << 1) | ((instr >> 20) & 1)]
         
-        # Build register list
+        return f"{prefix} R{rn}, {self._reglist_str(reg_list)}"
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _reglist_str(reg_list: int) -> str:
+        """Format a 16-bit register list (cached: real code reuses a few)"""
         regs = []
-        for i in range(16):
-            if reg_list & (1 << i):
-                regs.append(f"R{i}")
-        
-        reg_str = '{' + ', '.join(regs) + '}'
+        while reg_list:
+            # Lowest set bit first, so registers come out in ascending order
+            low = reg_list & -reg_list
+            regs.append(f"R{low.bit_length() - 1}")
+            reg_list ^= low
         
-        return f"{mnemonic}{cond} R{rn}, {reg_str}"
+        return '{' + ', '.join(regs) + '}'
     
-    def disasm_branch(self, instr: int, cond: str, addr: int) -> str:
+    def disasm_branch(self, instr: int, addr: int) -> str:
         """Disassemble branch instruction"""
-        is_link = (instr >> 24) & 1
-        offset = instr & 0xFFFFFF
+        offset = self.sign_extend_24(instr)
         
-        # Sign extend
-        if offset & 0x800000:
-            offset |= 0xFF000000
+        # Calculate target (PC+8 + offset*4), wrapping at 32 bits
+        target = (addr + 8 + (offset << 2)) & 0xFFFFFFFF
         
-        # Calculate target (PC+8 + offset*4)
-        target = addr + 8 + (self.sign_extend_24(offset) << 2)
-        
-        mnemonic = 'BL' if is_link else 'B'
+        # Mnemonic + condition, keyed by cond and L (bit 24)
+        prefix = self._BRANCH_PREFIX[(((instr >> 28) & 0xF) << 1) | ((instr >> 24) & 1)]
         
         # Check if we have a symbol for this address
-        if target in self.symbols:
-            return f"{mnemonic}{cond} {self.symbols[target]}"
+        name = self.symbols.get(target)
+        if name is not None:
+            return "%s %s" % (prefix, name)
         else:
-            return f"{mnemonic}{cond} 0x{target:08X}"
+            return "%s 0x%08X" % (prefix, target)
     
-    def disasm_swi(self, instr: int, cond: str) -> str:
+    def disasm_swi(self, instr: int) -> str:
         """Disassemble software interrupt"""
+        cond = self.COND_CODES[(instr >> 28) & 0xF]
         comment = instr & 0xFFFFFF
         return f"SWI{cond} 0x{comment:X}"
     
     def sign_extend_24(self, value: int) -> int:
         """Sign extend 24-bit value to 32-bit"""
-        if value & 0x800000:
-            return value | 0xFF000000
-        return value
+        return ((value & 0xFFFFFF) ^ 0x800000) - 0x800000 & 0xFFFFFFFF
     
     def rotate_right(self, value: int, amount: int) -> int:
-        """Rotate right"""
-        amount = amount % 32
+        """Rotate right (amount 0-31)"""
         return ((value >> amount) | (value << (32 - amount))) & 0xFFFFFFFF
     
-    def disassemble_file(self, filename: str, base_addr: int = 0):
-        """Disassemble a binary file"""
+    @staticmethod
+    @contextlib.contextmanager
+    def _map_words(filename: str):
+        """Map a binary file read-only, yielding its whole words as ints"""
         with open(filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if stat.S_ISREG(st.st_mode):
+                if st.st_size < 4:
+                    # mmap rejects empty files; nothing to decode anyway
+                    yield ()
+                    return
+                
+                if sys.byteorder == 'little':
+                    try:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError):
+                        pass  # Not mappable here; read it below instead
+                    else:
+                        # Zero-copy view of the little-endian words
+                        with mm, memoryview(mm) as view, \
+                             view[:len(view) & ~3] as raw, \
+                             raw.cast('I') as words:
+                            yield words
+                        return
+            
+            # Pipes, devices and big-endian hosts: copy the words into an array
             data = f.read()
+            words = array.array('I')
+            words.frombytes(data[:len(data) & ~3])
+            if sys.byteorder != 'little':
+                words.byteswap()
+            with memoryview(words) as view:
+                yield view
+    
+    def _label_list(self) -> List[Tuple[int, str]]:
+        """Symbols in address order, with a sentinel past the last one"""
+        labels = sorted(self.symbols.items())
+        labels.append((1 << 64, ''))
+        return labels
+    
+    def _format_block(self, words, addr: int,
+                      labels: List[Tuple[int, str]]) -> str:
+        """Format consecutive instruction words starting at addr"""
+        out = []
+        emit = out.append
+        disassemble = self.disassemble_instruction
         
-        self.base_addr = base_addr
-        addr = base_addr
-        
-        print(f"; Disassembly of {filename}")
-        print(f"; Base address: 0x{base_addr:08X}")
-        print()
+        # Walk the labels alongside the instructions
+        label_idx = bisect.bisect_left(labels, (addr,))
+        next_label = labels[label_idx][0]
         
-        # Disassemble 4 bytes at a time
-        for i in range(0, len(data), 4):
-            if i + 4 > len(data):
-                break
-            
-            instr = struct.unpack('<I', data[i:i+4])[0]
-            
+        for instr in words:
             # Check for symbol at this address
-            if addr in self.symbols:
-                print(f"\n{self.symbols[addr]}:")
-            
-            disasm = self.disassemble_instruction(instr, addr)
-            print(f"  {addr:08X}:  {instr:08X}  {disasm}")
+            if addr >= next_label:
+                # Skip symbols that fall between instructions
+                while labels[label_idx][0] < addr:
+                    label_idx += 1
+                if labels[label_idx][0] == addr:
+                    emit(f"\n{labels[label_idx][1]}:\n")
+                    label_idx += 1
+                next_label = labels[label_idx][0]
             
+            emit(f"  {addr:08X}:  {instr:08X}  {disassemble(instr, addr)}\n")
             addr += 4
+        
+        return ''.join(out)
+    
+    def iter_disassembly(self, filename: str, base_addr: int = 0,
+                         jobs: int = 1) -> Iterator[str]:
+        """Yield the disassembly of a binary file in blocks of text"""
+        self.base_addr = base_addr
+        labels = self._label_list()
+        block = self.BLOCK_WORDS
+        
+        # Decode every whole word (trailing bytes are ignored).
+        # No view of words may outlive this block, or closing the mmap raises
+        # BufferError: the -j path never slices it (workers map the file
+        # themselves) and the serial path releases each slice before yielding.
+        with self._map_words(filename) as words:
+            # Header only once the input has been opened successfully
+            yield (f"; Disassembly of {filename}\n"
+                   f"; Base address: 0x{base_addr:08X}\n"
+                   "\n")
+            
+            count = len(words)
+            # Workers reopen the input by path, so pipes and devices stay serial
+            path = os.path.realpath(filename)
+            
+            if jobs > 1 and count > block and os.path.isfile(path):
+                # Workers map the file themselves and each format a run of
+                # whole blocks; only a few runs are pending at once, in order
+                step = block * self.JOB_BLOCKS
+                with concurrent.futures.ProcessPoolExecutor(
+                        jobs, initializer=_init_worker,
+                        initargs=(type(self), self.symbols)) as pool:
+                    pending = collections.deque()
+                    for i in range(0, count, step):
+                        pending.append(pool.submit(_disassemble_chunk, path, i,
+                                                   min(step, count - i),
+                                                   base_addr + 4 * i))
+                        if len(pending) >= jobs * self.JOB_BACKLOG:
+                            yield pending.popleft().result()
+                    while pending:
+                        yield pending.popleft().result()
+            else:
+                # Stream one block at a time, so output starts immediately
+                for i in range(0, count, block):
+                    # Release the slice before yielding, even if formatting fails
+                    with words[i:i + block] as chunk:
+                        text = self._format_block(chunk, base_addr + 4 * i, labels)
+                    yield text
+    
+    def disassemble_file(self, filename: str, base_addr: int = 0, jobs: int = 1):
+        """Disassemble a binary file"""
+        write = sys.stdout.write
+        for text in self.iter_disassembly(filename, base_addr, jobs):
+            write(text)
+
+
+# Disassembler and label list of a -j worker process (set by _init_worker)
+_worker: Optional[Tuple[ARM7Disassembler, List[Tuple[int, str]]]] = None
+
+def _init_worker(cls, symbols: Dict[int, str]):
+    """Pool initializer for iter_disassembly(jobs > 1)"""
+    global _worker
+    disasm = cls(symbols)
+    _worker = (disasm, disasm._label_list())
+
+def _disassemble_chunk(filename: str, start: int, count: int, addr: int) -> str:
+    """Worker for iter_disassembly(jobs > 1): format words[start:start + count]"""
+    disasm, labels = _worker
+    with disasm._map_words(filename) as words, \
+         words[start:start + count] as chunk:
+        return disasm._format_block(chunk, addr, labels)
+
+def _jobs(value: str) -> int:
+    """argparse type for -j/--jobs: a positive integer"""
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {jobs}")
+    return jobs
 
 def main():
     parser = argparse.ArgumentParser(description='ARM7 Disassembler')
@@ -237,6 +389,8 @@ def main():
     parser.add_argument('-b', '--base-addr', type=lambda x: int(x, 0), default=0,
                         help='Base address (default: 0x00000000)')
     parser.add_argument('-s', '--symbols', help='Symbol file')
+    parser.add_argument('-j', '--jobs', type=_jobs, default=1,
+                        help='Worker processes for large binaries (default: 1)')
     
     args = parser.parse_args()
     
@@ -244,16 +398,11 @@ def main():
     symbols = {}
     if args.symbols:
         with open(args.symbols, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) >= 2:
-                    addr = int(parts[0], 16)
-                    name = parts[1]
-                    symbols[addr] = name
+            symbols = {int(addr, 16): name for addr, name in _SYM_RE.findall(f.read())}
     
     # Disassemble
     disasm = ARM7Disassembler(symbols)
-    disasm.disassemble_file(args.input_file, args.base_addr)
+    disasm.disassemble_file(args.input_file, args.base_addr, args.jobs)
 
 if __name__ == '__main__':
     main()